@@ -54,24 +54,45 @@ pub fn repack_with_metadata(
 /// `No such file or directory`。关闭后 symlink 按 symlink 存，不 follow。
 fn repack_lpkg(extract_dir: &Path, out_path: &Path) -> Result<(), String> {
     // 构建仓库 repack：快速（level 3）。仓库会被频繁重打包，不需要高压缩。
-    repack_lpkg_at(extract_dir, out_path, 3)
+    // level 3 压缩很快，不是瓶颈，保持单线程。
+    repack_lpkg_at(extract_dir, out_path, 3, 0)
 }
 
 /// export 用途：zstd level 22（ultra 档，最高压缩）重打包，用于发行/分发。
+///
+/// level 22 是纯 CPU 瓶颈，而 export 逐包串行，故开 zstd 多线程（NbWorkers = 核数）。
+/// 多线程按 job 切分输入，job 大小见 [`MT_JOB_SIZE`]。
 pub fn export_lpkg(extract_dir: &Path, out_path: &Path) -> Result<(), String> {
-    repack_lpkg_at(extract_dir, out_path, 22)
+    let workers = std::thread::available_parallelism().map_or(1, |n| n.get() as u32);
+    repack_lpkg_at(extract_dir, out_path, 22, workers)
 }
 
-fn repack_lpkg_at(extract_dir: &Path, out_path: &Path, level: i32) -> Result<(), String> {
+/// zstd 多线程压缩的 job 大小。
+///
+/// 不设时 libzstd 按 windowLog 推算：level 22（windowLog 27）下 job 为 512 MiB，
+/// 小于 512 MiB 的包（几乎所有包）只有一个 job，多线程形同虚设。64 MiB 让中大型包
+/// 能切成多个 job 并行；代价是 job 边界处只能借助重叠窗口引用前文，压缩率略降。
+const MT_JOB_SIZE: u32 = 64 << 20;
+
+/// `workers` 为 zstd 压缩线程数，0 = 单线程（调用线程内压缩）。
+fn repack_lpkg_at(
+    extract_dir: &Path,
+    out_path: &Path,
+    level: i32,
+    workers: u32,
+) -> Result<(), String> {
     let tmp = out_path.with_extension("lpkg.tmp");
     let f = fs::File::create(&tmp).map_err(|e| format!("创建 {tmp:?} 失败: {e}"))?;
-    let enc = zstd::stream::write::Encoder::new(f, level)
+    let mut enc = zstd::stream::write::Encoder::new(f, level)
         .map_err(|e| format!("zstd 初始化失败: {e}"))?;
+    if workers > 0 {
+        enc.multithread(workers)
+            .and_then(|_| enc.set_parameter(zstd::stream::raw::CParameter::JobSize(MT_JOB_SIZE)))
+            .map_err(|e| format!("zstd 多线程初始化失败: {e}"))?;
+    }
     let mut builder = tar::Builder::new(enc);
     builder.follow_symlinks(false);
-    builder
-        .append_dir_all(".", extract_dir)
-        .map_err(|e| format!("tar 打包失败: {e}"))?;
+    append_metadata_first(&mut builder, extract_dir)?;
     let enc = builder.into_inner().map_err(|e| format!("tar 收尾失败: {e}"))?;
     let mut f = enc.finish().map_err(|e| format!("zstd 收尾失败: {e}"))?;
     f.flush().map_err(|e| format!("flush 失败: {e}"))?;
@@ -79,6 +100,39 @@ fn repack_lpkg_at(extract_dir: &Path, out_path: &Path, level: i32) -> Result<(),
     Ok(())
 }
 
+/// 打包 `extract_dir`，metadata.json 紧跟根目录项排在最前，其余顶层项按名字排序。
+///
+/// `append_dir_all` 按 `read_dir` 顺序（随文件系统而定）打包，metadata.json 可能落在
+/// content 之后；读元数据的一方（lrepo-mgr push、`scan::read_lpkg_metadata`）流式解压到
+/// metadata.json 即停，放首项才不必解压整个 content。与 lpkg packer 的成员顺序一致。
+fn append_metadata_first<W: Write>(
+    builder: &mut tar::Builder<W>,
+    extract_dir: &Path,
+) -> Result<(), String> {
+    builder
+        .append_dir(".", extract_dir)
+        .and_then(|_| {
+            builder.append_path_with_name(extract_dir.join("metadata.json"), "metadata.json")
+        })
+        .map_err(|e| format!("tar 打包失败: {e}"))?;
+    let mut rest: Vec<_> = fs::read_dir(extract_dir)
+        .and_then(|it| it.collect::<Result<Vec<_>, _>>())
+        .map_err(|e| format!("读 {extract_dir:?} 失败: {e}"))?;
+    rest.retain(|e| e.file_name() != "metadata.json");
+    rest.sort_by_key(|e| e.file_name());
+    for e in rest {
+        // file_type() 不 follow symlink：顶层 symlink 按 symlink 存
+        let is_dir = e.file_type().map(|t| t.is_dir()).unwrap_or(false);
+        let r = if is_dir {
+            builder.append_dir_all(e.file_name(), e.path())
+        } else {
+            builder.append_path_with_name(e.path(), e.file_name())
+        };
+        r.map_err(|err| format!("tar 打包失败: {err}"))?;
+    }
+    Ok(())
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -141,6 +195,26 @@ mod tests {
         fs::remove_dir_all(&dir).ok();
     }
 
+    #[test]
+    fn repack_puts_metadata_json_first() {
+        let (lpkg, src) = make_fake_lpkg();
+        let extract = std::env::temp_dir().join("farm-repack-order");
+        repack_with_metadata(&lpkg, &extract, &[], &[]).unwrap();
+        let dec = zstd::stream::read::Decoder::new(fs::File::open(&lpkg).unwrap()).unwrap();
+        let mut ar = tar::Archive::new(dec);
+        let first_file = ar
+            .entries()
+            .unwrap()
+            .map(|e| e.unwrap())
+            .find(|e| e.header().entry_type() != tar::EntryType::Directory)
+            .map(|e| e.path().unwrap().into_owned())
+            .unwrap();
+        assert_eq!(first_file, PathBuf::from("metadata.json"));
+        fs::remove_dir_all(&src).ok();
+        fs::remove_dir_all(&extract).ok();
+        fs::remove_file(&lpkg).ok();
+    }
+
     #[test]
     fn repack_survives_broken_symlink_in_content() {
         // 复现 dbus/ncurses 等 seed 失败：content 含损坏 symlink，repack 不能炸。
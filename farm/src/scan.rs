@@ -81,7 +81,7 @@ pub(crate) fn read_metadata_json(path: &Path) -> Result<serde_json::Value, Strin
 }
 
 /// 流式读 .lpkg 的 metadata.json（不落盘 content）——seed 判断"是否已剥 needed_so"用。
-/// 若 metadata.json 是 tar 首项，则只解压到它为止，开销小。
+/// metadata.json 是 tar 首项（lpkg packer 与 repack 都保证），只解压到它为止，开销小。
 pub fn read_lpkg_metadata(lpkg_path: &Path) -> Result<serde_json::Value, String> {
     let f = fs::File::open(lpkg_path).map_err(|e| format!("打开 {lpkg_path:?} 失败: {e}"))?;
     let dec = zstd::stream::read::Decoder::new(f)
@@ -120,7 +120,7 @@ fn scan_content(content_dir: &Path) -> (Vec<String>, Vec<String>) {
             let is_so = fpath
                 .file_name()
                 .and_then(|n| n.to_str())
-                .is_some_and(|n| n.contains(".so"));
+                .is_some_and(is_shared_lib_name);
             if is_so && in_system_lib_dir(fpath, content_dir) {
                 let resolved = if target.is_absolute() {
                     target
@@ -150,7 +150,7 @@ fn scan_content(content_dir: &Path) -> (Vec<String>, Vec<String>) {
         } else if in_lib {
             // 无 SONAME 回退：文件名本身是其他包的 DT_NEEDED 目标
             if let Some(n) = fpath.file_name().and_then(|n| n.to_str()) {
-                if n.contains(".so") {
+                if is_shared_lib_name(n) {
                     provides.insert(n.to_string());
                 }
             }
@@ -189,6 +189,20 @@ fn basename(s: &str) -> String {
     s.rsplit('/').next().unwrap_or(s).to_string()
 }
 
+/// 文件名是否为共享库名：`.so` 结尾，或 `.so` 后只跟数字版本段（`libz.so.1.3.1`）。
+/// 不用子串匹配——`libfoo.so.1.debug`、`libstdc++.so.6.0.33-gdb.py` 不是 DT_NEEDED 目标，
+/// 收进 provides 只会制造假提供者。
+fn is_shared_lib_name(name: &str) -> bool {
+    name.match_indices(".so").any(|(i, _)| {
+        let rest = &name[i + 3..];
+        rest.is_empty()
+            || rest.strip_prefix('.').is_some_and(|ver| {
+                ver.split('.')
+                    .all(|seg| !seg.is_empty() && seg.bytes().all(|b| b.is_ascii_digit()))
+            })
+    })
+}
+
 fn is_elf(path: &Path) -> bool {
     let Ok(f) = fs::File::open(path) else { return false };
     let mut magic = [0u8; 4];
@@ -258,6 +272,20 @@ mod tests {
         assert!(!in_system_lib_dir(Path::new("/x/content/usr/bin/lpkg"), c));
     }
 
+    #[test]
+    fn shared_lib_name_requires_so_suffix() {
+        assert!(is_shared_lib_name("libz.so"));
+        assert!(is_shared_lib_name("libz.so.1"));
+        assert!(is_shared_lib_name("libicudata.so.76.1"));
+        assert!(is_shared_lib_name("ld-linux-x86-64.so.2"));
+        assert!(is_shared_lib_name("libpython3.13.so.1.0"));
+        assert!(!is_shared_lib_name("libfoo.so.1.debug"));
+        assert!(!is_shared_lib_name("libstdc++.so.6.0.33-gdb.py"));
+        assert!(!is_shared_lib_name("foo.son"));
+        assert!(!is_shared_lib_name("libz.so."));
+        assert!(!is_shared_lib_name("libz.a"));
+    }
+
     #[test]
     fn is_elf_magic_check() {
         let f = std::env::temp_dir().join("farm-scan-elf-test");
@@ -1,57 +1,194 @@
 #!/usr/bin/env python3
 import os
 import sys
+import io
+import copy
 import json
+import shlex
 import hashlib
+import contextlib
 import subprocess
-import tempfile
 import argparse
+import tarfile
 import glob
+import fnmatch
+import re
+import threading
+import concurrent.futures
 from pathlib import Path
 
-def calculate_sha256(file_path):
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
-
-def extract_metadata(archive_path):
-    """Extracts metadata from metadata.json inside the archive."""
-    deps = ""
-    provides = ""
-    needed_so = ""
+# push 时并发处理的包数默认值（上传以网络往返为主），可由配置 concurrency 覆盖
+PUSH_WORKERS = 16
+# 单个文件分片上传的并发数与分片大小默认值，可由 storage.max_concurrency /
+# storage.multipart_chunksize（字节）覆盖
+TRANSFER_CONCURRENCY = 8
+MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+# botocore Config 的固定选项（连接池大小随并发配置另行传入）；
+# 校验和只在接口要求时计算，COS 等兼容实现不支持新版默认校验
+S3_CLIENT_OPTS = {
+    "s3": {"addressing_style": "virtual"},
+    "signature_version": "s3v4",
+    "request_checksum_calculation": "when_required",
+    "response_checksum_validation": "when_required",
+}
+# S3 DeleteObjects 单次请求的 key 上限
+S3_DELETE_BATCH = 1000
+# SCP 批量删除时单条 rm 命令的路径数
+SCP_DELETE_BATCH = 500
+
+# ssh 连接复用：同一目标的所有调用共享一条 ControlMaster 连接，只握手一次
+SSH_MUX_OPTS = ["-o", "ControlMaster=auto",
+                "-o", "ControlPath=~/.ssh/lrepo-%C",
+                "-o", "ControlPersist=60s"]
+
+# 通配符判定（与 glob 模块内部一致；glob.has_magic 不是公开接口）
+_MAGIC_RE = re.compile(r'[*?[]')
+
+# push 的本地缓存：按 (路径, 大小, mtime) 记录包的 sha256 与元数据
+HASH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "lrepo-mgr", "hashcache.json")
+
+def log(msg):
+    """输出一行日志。整行一次写出，并发线程的输出不会交错在同一行。"""
+    sys.stdout.write(f"{msg}\n")
+
+@contextlib.contextmanager
+def open_sequential(path):
+    """以只读方式打开要整读一遍的包文件。
+
+    读前提示内核顺序预读；读完丢弃其页缓存，包只推送一次，不必占着缓存。
+    """
+    with open(path, 'rb') as f:
+        fadvise = getattr(os, "posix_fadvise", None)
+        if fadvise:
+            with contextlib.suppress(OSError):
+                fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        try:
+            yield f
+        finally:
+            if fadvise:
+                with contextlib.suppress(OSError):
+                    fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+class _HashingReader:
+    """只读文件包装：经 read() 读出的字节同时喂给 hasher。"""
+    def __init__(self, f, hasher):
+        self._f = f
+        self._hasher = hasher
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._hasher.update(data)
+        return data
+
+def _metadata_from_stream(fileobj):
+    """从 .lpkg 字节流中取出 metadata.json（找到即停），不关闭 fileobj。"""
+    import zstandard
+    with zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False) as zr:
+        with tarfile.open(fileobj=zr, mode='r|') as tf:
+            for member in tf:
+                if member.isfile() and member.name in ('metadata.json', './metadata.json'):
+                    return json.loads(tf.extractfile(member).read())
+    return None
+
+def read_archive_metadata(archive_path):
+    """读取 .lpkg 内的 metadata.json，返回 dict；读取失败返回 None。
+
+    metadata.json 是归档首项（lpkg 打包与 farm repack/export 都保证），流式解压到它即停，不解压 content。
+    未安装 zstandard 时回退到 tar 子进程。
+    """
     try:
-        result = subprocess.run(['tar', '--use-compress-program=zstd', '-xf', archive_path, '--wildcards', '*metadata.json', '-O'],
-                                capture_output=True, text=True)
-        if result.returncode == 0 and result.stdout.strip():
-            meta = json.loads(result.stdout)
-            deps = ",".join(meta.get('deps', []))
-            provides = ",".join(meta.get('provides', []))
-            needed_so = ",".join(meta.get('needed_so', []))
+        try:
+            import zstandard
+        except ImportError:
+            # --occurrence=1：取到第一个 metadata.json 即停，不再扫完整个归档
+            result = subprocess.run(
+                ['tar', '--use-compress-program=zstd', '-xf', archive_path, '--wildcards', '--occurrence=1', '*metadata.json', '-O'],
+                capture_output=True, text=True
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                return json.loads(result.stdout)
+            return None
+        with open(archive_path, 'rb') as fh:
+            return _metadata_from_stream(fh)
     except Exception as e:
-        print(f"  Warning: Failed to extract metadata from {archive_path}: {e}")
-
-    return deps, provides, needed_so
+        log(f"  Warning: Failed to read metadata.json from {archive_path}: {e}")
+    return None
+
+def expand_patterns(patterns):
+    """展开 push 的文件通配符，返回匹配到的普通文件路径列表（已去重）。
+
+    结果按命令行上模式的先后排列：同名同版本的包以后出现者为准，顺序决定谁胜出。
+    每个目录只 scandir 一次并缓存列表，重叠的模式不再重复扫描同一目录；
+    目录部分带通配符时回退到 glob。
+    """
+    # 以绝对路径去重：同一文件被多个模式匹配到时只推送一次，位置取首次出现处
+    files = {}
+    listings = {}
+    for p in patterns:
+        dirname, base = os.path.split(p)
+        if _MAGIC_RE.search(dirname) or not _MAGIC_RE.search(base):
+            matches = [f for f in glob.glob(p) if os.path.isfile(f)]
+        else:
+            if dirname not in listings:
+                try:
+                    with os.scandir(dirname or '.') as it:
+                        # is_file() 用 scandir 已取得的类型，不再额外 stat
+                        listings[dirname] = [e.name for e in it if e.is_file()]
+                except OSError:
+                    listings[dirname] = []
+            # 与 glob 一致：隐藏文件只由以 '.' 开头的模式匹配
+            matches = [os.path.join(dirname, name) for name in listings[dirname]
+                       if (not name.startswith('.') or base.startswith('.')) and fnmatch.fnmatch(name, base)]
+        for f in matches:
+            files.setdefault(os.path.abspath(f), f)
+    return list(files.values())
+
+def load_hash_cache():
+    try:
+        with open(HASH_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def cached_package(cache, key, st):
+    """返回缓存中仍然有效的 (sha256, meta)；未命中、文件已变或缓存项格式不对时返回 None。"""
+    entry = cache.get(key)
+    if not isinstance(entry, dict):
+        return None
+    if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    sha256, meta = entry.get("sha256"), entry.get("meta")
+    if not isinstance(sha256, str) or len(sha256) != 64 or not isinstance(meta, dict):
+        return None
+    if not all(isinstance(meta.get(k), str) for k in ("name", "version")):
+        return None
+    if not all(isinstance(meta.get(k), list) for k in ("deps", "provides", "needed_so")):
+        return None
+    return sha256, meta
 
-def read_metadata_from_archive(archive_path):
-    """Extracts metadata.json from the lpkg archive and returns name, version."""
+def save_hash_cache(cache):
+    # 丢弃已不存在的文件的缓存项，缓存大小随本地现存的包而定
+    cache = {k: v for k, v in cache.items() if os.path.isfile(k)}
     try:
-        result = subprocess.run(
-            ['tar', '--use-compress-program=zstd', '-xf', archive_path, '--wildcards', '*metadata.json', '-O'],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            meta = json.loads(result.stdout)
-            return meta.get('name', ''), meta.get('version', '')
-    except Exception as e:
-        print(f"  Warning: Failed to read metadata.json from {archive_path}: {e}")
-    return None, None
+        os.makedirs(os.path.dirname(HASH_CACHE_PATH), exist_ok=True)
+        tmp = f"{HASH_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp, HASH_CACHE_PATH)
+    except OSError as e:
+        print(f"Warning: Failed to save hash cache: {e}")
 
 class RepoManager:
     def __init__(self, config_path):
         self.config_path = config_path
         self.load_config()
+        # boto3 client 线程安全，构建代价高（加载服务模型、签名器），全程复用一个
+        self._s3_client = None
+        self._s3_client_lock = threading.Lock()
+        self._transfer_config = None
+        self._ssh_master_ready = False
+        self._ssh_master_lock = threading.Lock()
 
     def load_config(self):
         if not os.path.exists(self.config_path):
@@ -77,31 +214,67 @@ class RepoManager:
         with open(self.config_path, 'w') as f:
             json.dump(self.config, f, indent=4)
 
+    def concurrency(self):
+        """并发处理的包数（配置项 concurrency，config --set 写入的是字符串）。"""
+        return max(1, int(self.config.get("concurrency", PUSH_WORKERS)))
+
+    def _ssh_target(self):
+        """SCP 后端的 user@host；首次调用时先建立 ControlMaster 连接。
+
+        预先建好 master，随后并发的 ssh 直接复用它；否则多个线程会同时
+        抢当 master，抢输的各自另起连接，复用失效。
+        """
+        st = self.config["storage"]
+        target = f"{st['user']}@{st['host']}"
+        with self._ssh_master_lock:
+            if not self._ssh_master_ready:
+                subprocess.run(["ssh", *SSH_MUX_OPTS, target, "true"], check=True)
+                self._ssh_master_ready = True
+        return target
+
     def get_storage(self):
         st = self.config.get("storage", {})
         st_type = st.get("type", "s3")
         if st_type == "s3":
-            import boto3
-            from botocore.client import Config
-            session = boto3.session.Session()
-            return session.client('s3',
-                                  region_name=st.get('region'),
-                                  endpoint_url=st.get('endpoint'),
-                                  aws_access_key_id=st.get('access_key'),
-                                  aws_secret_access_key=st.get('secret_key'),
-                                  config=Config(
-                                      s3={'addressing_style': 'virtual'},
-                                      signature_version='s3v4',
-                                      request_checksum_calculation='when_required',
-                                      response_checksum_validation='when_required'
-                                  ))
+            with self._s3_client_lock:
+                if self._s3_client is None:
+                    import boto3
+                    from boto3.s3.transfer import TransferConfig
+                    from botocore.client import Config
+                    # config --set 写入的是字符串
+                    transfer_concurrency = max(1, int(st.get("max_concurrency", TRANSFER_CONCURRENCY)))
+                    chunksize = int(st.get("multipart_chunksize", MULTIPART_CHUNKSIZE))
+                    session = boto3.session.Session()
+                    client = session.client('s3',
+                                          region_name=st.get('region'),
+                                          endpoint_url=st.get('endpoint'),
+                                          aws_access_key_id=st.get('access_key'),
+                                          aws_secret_access_key=st.get('secret_key'),
+                                          config=Config(
+                                              **S3_CLIENT_OPTS,
+                                              # 每个 push 线程各自还有分片并发，连接池按两者乘积放大
+                                              max_pool_connections=self.concurrency() * transfer_concurrency
+                                          ))
+                    # 大包走分片并发上传，单个文件也能吃满带宽
+                    transfer_config = TransferConfig(
+                        multipart_threshold=8 * 1024 * 1024,
+                        multipart_chunksize=chunksize,
+                        max_concurrency=transfer_concurrency,
+                        use_threads=True)
+                    # upload_package 传入的是不可 seek 的流，s3transfer 会把分片读进内存排队，
+                    # 默认最多排 10 片；按分片并发数封顶，每个文件至多约
+                    # 2 × max_concurrency × multipart_chunksize 驻留内存。
+                    # boto3 的 TransferConfig 构造函数不接受该参数，只能设属性（s3transfer 基类读取它）
+                    transfer_config.max_in_memory_upload_chunks = transfer_concurrency
+                    # 两者都构建成功后才一起保存，构建失败不会留下半初始化状态
+                    self._transfer_config = transfer_config
+                    self._s3_client = client
+                return self._s3_client
         return None
 
-    def push_packages(self, patterns):
-        files = []
-        for p in patterns:
-            files.extend(glob.glob(p))
-        
+    def push_packages(self, patterns, use_cache=True):
+        files = expand_patterns(patterns)
+
         if not files:
             print("No files matched patterns.")
             return
@@ -110,49 +283,93 @@ class RepoManager:
         prefix = self.config["storage"].get("path_prefix", "").strip('/')
         if prefix: prefix += '/'
 
-        index_local = self.download_index()
-        index_data = self.parse_aggregated_index(index_local)
-
-        for f in files:
-            path = Path(f)
-            if not path.is_file(): continue
-            
-            name, version = read_metadata_from_archive(str(path))
-            if not name:
-                print(f"Skipping {path.name}: Could not determine package name and version (missing metadata.json or invalid filename)")
-                continue
-            
-            print(f"Processing {name} {version}...")
-            sha256 = calculate_sha256(f)
-            deps, provides, needed_so = extract_metadata(f)
-
-            # Upload package as name/version.lpkg
-            remote_pkg_path = f"{prefix}{arch}/{name}/{version}.lpkg"
-            self.upload_file(str(path), remote_pkg_path)
-
-            # Update index data
-            if name not in index_data:
-                index_data[name] = {"versions": {}}
-
-            index_data[name]["versions"][version] = {
-                "sha256": sha256,
-                "deps": deps,
-                "provides": provides,
-                "needed_so": needed_so,
-            }
+        paths = [Path(f) for f in files]
+        cache = load_hash_cache() if use_cache else {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency()) as ex:
+            # index 下载与包处理互不依赖，一起提交，合并前再取结果
+            idx_future = ex.submit(lambda: self.parse_aggregated_index(self.download_index()))
+
+            # 先并发读出各包的 name/version；同一 name/version 只保留最后一个文件
+            # （与 index 中后者覆盖前者一致），再开始上传，避免两个文件并发写同一远端对象
+            chosen = {}
+            for pkg in ex.map(lambda path: self._resolve_one(path, cache), paths):
+                if pkg is None: continue
+                nv = (pkg["meta"]["name"], pkg["meta"]["version"])
+                if nv in chosen:
+                    log(f"Warning: {chosen[nv]['path']} and {pkg['path']} are both {nv[0]} {nv[1]}, pushing the latter")
+                    del chosen[nv]
+                chosen[nv] = pkg
+
+            # 各包上传相互独立，以存储端往返为主，并发执行；index_data 只在主线程合并，无需加锁
+            results = ex.map(lambda pkg: self._push_one(pkg, f"{prefix}{arch}/"), chosen.values())
+            index_data = idx_future.result()
+            for name, version, entry, (key, cached) in results:
+                cache[key] = cached
+                # Update index data
+                if name not in index_data:
+                    index_data[name] = {"versions": {}}
+                index_data[name]["versions"][version] = entry
+        if use_cache:
+            save_hash_cache(cache)
 
         # Save and upload aggregated index
-        self.write_aggregated_index(index_local, index_data)
-        self.upload_file(index_local, f"{prefix}{arch}/index.txt")
+        self.upload_bytes(self.format_aggregated_index(index_data).encode('utf-8'), f"{prefix}{arch}/index.txt")
         print("Done.")
 
+    def _resolve_one(self, path, cache):
+        """取得单个包的元数据（及缓存中的哈希），返回 dict；无法识别时返回 None。
+
+        缓存命中（路径、大小、mtime 均未变）时不再读元数据，哈希也不必重算。
+        """
+        st = path.stat()
+        key = str(path.resolve())
+        hit = cached_package(cache, key, st)
+        if hit:
+            sha256, meta = hit
+        else:
+            meta = read_archive_metadata(str(path)) or {}
+            sha256 = None
+        name, version = meta.get('name', ''), meta.get('version', '')
+        if not name:
+            log(f"Skipping {path.name}: Could not determine package name and version (missing metadata.json or invalid filename)")
+            return None
+        # 只留 index 用到的字段，也即缓存中保存的内容
+        meta = {
+            "name": name,
+            "version": version,
+            "deps": meta.get('deps', []),
+            "provides": meta.get('provides', []),
+            "needed_so": meta.get('needed_so', []),
+        }
+        return {"path": path, "key": key, "stat": st, "sha256": sha256, "meta": meta}
+
+    def _push_one(self, pkg, remote_base):
+        """上传 _resolve_one 解析出的包，返回 (name, version, index 条目, 缓存项)。"""
+        meta, st = pkg["meta"], pkg["stat"]
+        name, version = meta["name"], meta["version"]
+        log(f"Processing {name} {version}...")
+
+        remote_path = f"{remote_base}{name}/{version}.lpkg"
+        sha256 = pkg["sha256"]
+        if sha256 is None:
+            # Upload package as name/version.lpkg（哈希随上传读取一并算出）
+            sha256 = self.upload_package(str(pkg["path"]), remote_path)
+        else:
+            self.upload_file(str(pkg["path"]), remote_path)
+
+        return name, version, {
+            "sha256": sha256,
+            "deps": ",".join(meta['deps']),
+            "provides": ",".join(meta['provides']),
+            "needed_so": ",".join(meta['needed_so']),
+        }, (pkg["key"], {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256, "meta": meta})
+
     def delete_package(self, name, version=None):
         arch = self.config.get("architecture", "x86_64")
         prefix = self.config["storage"].get("path_prefix", "").strip('/')
         if prefix: prefix += '/'
         
-        index_local = self.download_index()
-        index_data = self.parse_aggregated_index(index_local)
+        index_data = self.parse_aggregated_index(self.download_index())
 
         if version:
             if name in index_data and version in index_data[name]["versions"]:
@@ -171,8 +388,7 @@ class RepoManager:
             if name in index_data:
                 del index_data[name]
 
-        self.write_aggregated_index(index_local, index_data)
-        self.upload_file(index_local, f"{prefix}{arch}/index.txt")
+        self.upload_bytes(self.format_aggregated_index(index_data).encode('utf-8'), f"{prefix}{arch}/index.txt")
         print("Done.")
 
     def cleanup_repository(self):
@@ -182,96 +398,170 @@ class RepoManager:
         prefix = self.config["storage"].get("path_prefix", "").strip('/')
         if prefix: prefix += '/'
         
-        index_local = self.download_index()
-        index_data = self.parse_aggregated_index(index_local)
+        index_data = self.parse_aggregated_index(self.download_index())
         
         remote_base = f"{prefix}{arch}/"
-        all_pkgs = self.list_remote_dirs(remote_base)
-        
-        for pkg in all_pkgs:
+        # 一次递归列出全部包目录及其文件，不再逐包列目录
+        tree = self.list_remote_tree(remote_base)
+
+        stale = []
+        orphans = []
+        for pkg, files in tree.items():
             if pkg not in index_data:
                 print(f"Package {pkg} is not in index, deleting entire package directory...")
-                self.delete_remote_dir(f"{remote_base}{pkg}/")
+                orphans.append(pkg)
                 continue
-            
             active_vers = index_data[pkg]["versions"]
-            # List all .lpkg files in the package directory
-            all_files = self.list_remote_files(f"{remote_base}{pkg}/")
-            for f in all_files:
+            for f in files:
                 if f.endswith('.lpkg'):
                     ver = f.rsplit('.', 1)[0]
                     if ver not in active_vers:
                         print(f"Deleting old version file: {pkg}/{f}...")
-                        self.delete_remote_file(f"{remote_base}{pkg}/{f}")
-        
+                        stale.append(f"{remote_base}{pkg}/{f}")
+
+        # 整目录删除互不依赖，纯网络往返，并发执行
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency()) as ex:
+            list(ex.map(lambda pkg: self.delete_remote_dir(f"{remote_base}{pkg}/"), orphans))
+
+        # 旧版本文件先收集，最后批量删除
+        self.delete_remote_files(stale)
         print("Cleanup complete.")
 
-    def parse_aggregated_index(self, path):
+    def parse_aggregated_index(self, text):
         # 格式: name|ver:hash:deps:provides:needed_so;ver2:...|
         data = {}
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'): continue
-                    parts = line.split('|')
-                    if len(parts) < 2: continue
-                    name = parts[0]
-
-                    for v_block in parts[1].split(';'):
-                        v_info = v_block.split(':')
-                        if len(v_info) < 2: continue
-
-                        version = v_info[0]
-                        hash_val = v_info[1]
-                        deps = v_info[2] if len(v_info) > 2 else ""
-                        # provides/needed_so 在版本块内（第 4、5 字段）
-                        provides = v_info[3] if len(v_info) > 3 else ""
-                        needed_so = v_info[4] if len(v_info) > 4 else ""
-
-                        if name not in data:
-                            data[name] = {"versions": {}}
-
-                        data[name]["versions"][version] = {
-                            "sha256": hash_val,
-                            "deps": deps,
-                            "provides": provides,
-                            "needed_so": needed_so,
-                        }
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] == '#': continue
+            name, sep, rest = line.partition('|')
+            if not sep: continue
+            v_blocks = rest.partition('|')[0]
+
+            versions = None
+            for v_block in v_blocks.split(';'):
+                v_info = v_block.split(':')
+                if len(v_info) < 2: continue
+                # provides/needed_so 在版本块内（第 4、5 字段），缺省补空串后一次解包
+                version, hash_val, deps, provides, needed_so = (v_info + ["", "", ""])[:5]
+
+                if versions is None:
+                    versions = data.setdefault(name, {"versions": {}})["versions"]
+                versions[version] = {
+                    "sha256": hash_val,
+                    "deps": deps,
+                    "provides": provides,
+                    "needed_so": needed_so,
+                }
         return data
 
-    def write_aggregated_index(self, path, data):
+    def format_aggregated_index(self, data):
         # 新版格式: name|ver:hash:deps:provides:needed_so;ver2:...|
-        with open(path, 'w', encoding='utf-8') as f:
-            for name, info in data.items():
-                blocks = []
-                for v, vinfo in info["versions"].items():
-                    provides = vinfo.get('provides', '')
-                    needed_so = vinfo.get('needed_so', '')
-                    blocks.append(f"{v}:{vinfo['sha256']}:{vinfo['deps']}:{provides}:{needed_so}")
-                f.write(f"{name}|{';'.join(blocks)}|\n")
+        lines = []
+        for name, info in data.items():
+            blocks = []
+            for v, vinfo in info["versions"].items():
+                provides = vinfo.get('provides', '')
+                needed_so = vinfo.get('needed_so', '')
+                blocks.append(f"{v}:{vinfo['sha256']}:{vinfo['deps']}:{provides}:{needed_so}")
+            lines.append(f"{name}|{';'.join(blocks)}|\n")
+        return "".join(lines)
 
     def upload_file(self, local_path, remote_path):
         st = self.config["storage"]
         if st["type"] == "s3":
             client = self.get_storage()
-            print(f"Uploading to S3: {remote_path}...")
-            client.upload_file(local_path, st["bucket"], remote_path)
+            log(f"Uploading to S3: {remote_path}...")
+            client.upload_file(local_path, st["bucket"], remote_path, Config=self._transfer_config)
         elif st["type"] == "scp":
-            print(f"Uploading via SCP: {remote_path}...")
-            host = st["host"]
-            user = st["user"]
-            remote_base_path = st["remote_path"].rstrip('/')
-            full_remote = f"{remote_base_path}/{remote_path}"
-            remote_dir = os.path.dirname(full_remote)
-            subprocess.run(["ssh", f"{user}@{host}", f"mkdir -p {remote_dir}"], check=True)
-            subprocess.run(["scp", local_path, f"{user}@{host}:{full_remote}"], check=True)
+            log(f"Uploading via SCP: {remote_path}...")
+            with open_sequential(local_path) as f:
+                self._ssh_write(remote_path, f)
         elif st["type"] == "local":
             dest = os.path.join(st["path"], remote_path)
             os.makedirs(os.path.dirname(dest), exist_ok=True)
             import shutil
             shutil.copy2(local_path, dest)
-            print(f"  Copied to {dest}")
+            log(f"  Copied to {dest}")
+        else:
+            raise ValueError(f"Unknown storage type: {st['type']}")
+
+    def _ssh_write(self, remote_path, src):
+        """把 src（可读文件对象）写到 SCP 后端的 remote_path。
+
+        mkdir 与写入合并为一次 ssh，内容经 stdin 流式传入，不整体读入内存。
+        """
+        st = self.config["storage"]
+        ssh_target = self._ssh_target()
+        full_remote = f"{st['remote_path'].rstrip('/')}/{remote_path}"
+        remote_dir = os.path.dirname(full_remote)
+        cmd = f"mkdir -p {shlex.quote(remote_dir)} && cat > {shlex.quote(full_remote)}"
+        import shutil
+        proc = subprocess.Popen(["ssh", *SSH_MUX_OPTS, ssh_target, cmd], stdin=subprocess.PIPE)
+        try:
+            shutil.copyfileobj(src, proc.stdin, 1 << 20)
+        except BrokenPipeError:
+            # 远端提前退出，错误由下面的返回码报告
+            pass
+        finally:
+            # 任何情况下都要关闭 stdin，否则远端 cat 等不到 EOF，wait() 永不返回；
+            # 读取出错时先让 ssh 退出，再抛出原异常
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    def upload_package(self, local_path, remote_path):
+        """上传包文件并返回其 SHA-256。
+
+        在上传读取的同一趟字节流上计算哈希，包文件只读一遍。
+        """
+        st = self.config["storage"]
+        sha256_hash = hashlib.sha256()
+        if st["type"] == "s3":
+            client = self.get_storage()
+            log(f"Uploading to S3: {remote_path}...")
+            # _HashingReader 不可 seek，s3transfer 会在单个线程里顺序读取各分片再并发上传，
+            # 因此哈希按文件顺序累积
+            with open_sequential(local_path) as f:
+                client.upload_fileobj(_HashingReader(f, sha256_hash), st["bucket"], remote_path,
+                                      Config=self._transfer_config)
+            return sha256_hash.hexdigest()
+        if st["type"] == "local":
+            dest = os.path.join(st["path"], remote_path)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            import shutil
+            with open_sequential(local_path) as src, open(dest, 'wb') as dst:
+                shutil.copyfileobj(_HashingReader(src, sha256_hash), dst, 1 << 20)
+            shutil.copystat(local_path, dest)
+            log(f"  Copied to {dest}")
+            return sha256_hash.hexdigest()
+        if st["type"] == "scp":
+            log(f"Uploading via SCP: {remote_path}...")
+            with open_sequential(local_path) as f:
+                self._ssh_write(remote_path, _HashingReader(f, sha256_hash))
+            return sha256_hash.hexdigest()
+        # 未知后端不能当作上传成功，否则 index 会写入一个并未上传的包
+        raise ValueError(f"Unknown storage type: {st['type']}")
+
+    def upload_bytes(self, data, remote_path):
+        """上传内存中的文本内容（如 index.txt），不经本地临时文件。"""
+        st = self.config["storage"]
+        if st["type"] == "s3":
+            client = self.get_storage()
+            log(f"Uploading to S3: {remote_path}...")
+            client.put_object(Bucket=st["bucket"], Key=remote_path, Body=data, ContentType="text/plain; charset=utf-8")
+        elif st["type"] == "scp":
+            log(f"Uploading via SCP: {remote_path}...")
+            self._ssh_write(remote_path, io.BytesIO(data))
+        elif st["type"] == "local":
+            dest = os.path.join(st["path"], remote_path)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as f:
+                f.write(data)
+            log(f"  Wrote {dest}")
+        else:
+            raise ValueError(f"Unknown storage type: {st['type']}")
 
     def delete_remote_file(self, remote_path):
         st = self.config["storage"]
@@ -279,14 +569,47 @@ class RepoManager:
             client = self.get_storage()
             client.delete_object(Bucket=st["bucket"], Key=remote_path)
         elif st["type"] == "scp":
-            host = st["host"]
-            user = st["user"]
+            ssh_target = self._ssh_target()
             remote_base = st["remote_path"].rstrip('/')
-            subprocess.run(["ssh", f"{user}@{host}", f"rm -f {remote_base}/{remote_path}"], check=True)
+            target = shlex.quote(f"{remote_base}/{remote_path}")
+            subprocess.run(["ssh", *SSH_MUX_OPTS, ssh_target, f"rm -f {target}"], check=True)
         elif st["type"] == "local":
             target = os.path.join(st["path"], remote_path)
             if os.path.exists(target): os.remove(target)
 
+    def delete_remote_files(self, remote_paths):
+        """批量删除：S3 每 1000 个 key 一次 DeleteObjects，SCP 一次 ssh rm。"""
+        remote_paths = list(remote_paths)
+        if not remote_paths: return
+        st = self.config["storage"]
+        if st["type"] == "s3":
+            self._s3_delete_keys(remote_paths)
+        elif st["type"] == "scp":
+            ssh_target = self._ssh_target()
+            remote_base = st["remote_path"].rstrip('/')
+            # 分批控制单条命令行长度
+            for i in range(0, len(remote_paths), SCP_DELETE_BATCH):
+                targets = " ".join(shlex.quote(f"{remote_base}/{p}") for p in remote_paths[i:i + SCP_DELETE_BATCH])
+                subprocess.run(["ssh", *SSH_MUX_OPTS, ssh_target, f"rm -f {targets}"], check=True)
+        elif st["type"] == "local":
+            for p in remote_paths:
+                self.delete_remote_file(p)
+
+    def _s3_delete_keys(self, keys):
+        st = self.config["storage"]
+        client = self.get_storage()
+        failed = []
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            batch = [{'Key': k} for k in keys[i:i + S3_DELETE_BATCH]]
+            resp = client.delete_objects(Bucket=st["bucket"], Delete={'Objects': batch, 'Quiet': True})
+            for err in resp.get('Errors', []):
+                log(f"  Failed to delete {err.get('Key')}: {err.get('Code')} {err.get('Message')}")
+                failed.append(err.get('Key'))
+        # DeleteObjects 对单个 key 的失败不抛异常，只在响应里列出；跑完所有批次后统一报错，
+        # 不能把删除失败当成功
+        if failed:
+            raise RuntimeError(f"Failed to delete {len(failed)} object(s) from S3")
+
     def delete_remote_dir(self, remote_dir_prefix):
         st = self.config["storage"]
         if st["type"] == "s3":
@@ -295,66 +618,58 @@ class RepoManager:
             pages = paginator.paginate(Bucket=st["bucket"], Prefix=remote_dir_prefix)
             for page in pages:
                 if 'Contents' in page:
-                    for obj in page['Contents']:
-                        client.delete_object(Bucket=st["bucket"], Key=obj['Key'])
+                    # 每页至多 1000 个 key，正好一次 DeleteObjects
+                    self._s3_delete_keys([obj['Key'] for obj in page['Contents']])
         elif st["type"] == "scp":
-            host = st["host"]
-            user = st["user"]
+            ssh_target = self._ssh_target()
             remote_base = st["remote_path"].rstrip('/')
-            subprocess.run(["ssh", f"{user}@{host}", f"rm -rf {remote_base}/{remote_dir_prefix}"], check=True)
+            target = shlex.quote(f"{remote_base}/{remote_dir_prefix}")
+            subprocess.run(["ssh", *SSH_MUX_OPTS, ssh_target, f"rm -rf {target}"], check=True)
         elif st["type"] == "local":
             target = os.path.join(st["path"], remote_dir_prefix)
             if os.path.exists(target): import shutil; shutil.rmtree(target)
 
-    def list_remote_dirs(self, prefix):
+    def list_remote_tree(self, prefix):
+        """列出 prefix 下的包目录及各自直属文件，返回 {包名: [文件名]}。
+
+        prefix 下的直属文件（如 index.txt）不算包目录。
+        """
         st = self.config["storage"]
-        dirs = []
+        tree = {}
         if st["type"] == "s3":
             client = self.get_storage()
             paginator = client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(Bucket=st["bucket"], Prefix=prefix, Delimiter='/')
-            for page in pages:
-                if 'CommonPrefixes' in page:
-                    for cp in page['CommonPrefixes']:
-                        name = cp['Prefix'][len(prefix):].rstrip('/')
-                        if name: dirs.append(name)
+            # 不带 Delimiter 递归列出，每页最多 1000 个 key
+            for page in paginator.paginate(Bucket=st["bucket"], Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    pkg, sep, name = obj['Key'][len(prefix):].partition('/')
+                    if not sep or not pkg: continue
+                    files = tree.setdefault(pkg, [])
+                    if name and '/' not in name: files.append(name)
         elif st["type"] == "scp":
-            host = st["host"]
-            user = st["user"]
+            ssh_target = self._ssh_target()
             remote_base = st["remote_path"].rstrip('/')
             full_path = f"{remote_base}/{prefix}"
-            result = subprocess.run(["ssh", f"{user}@{host}", f"ls -1F {full_path} 2>/dev/null | grep '/$' | sed 's|/||'"], 
+            # %y 为类型（d/f），%P 为相对 full_path 的路径
+            result = subprocess.run(["ssh", *SSH_MUX_OPTS, ssh_target, f"find {shlex.quote(full_path)} -mindepth 1 -maxdepth 2 -printf '%y %P\\n' 2>/dev/null"],
                                     capture_output=True, text=True)
             if result.returncode == 0:
-                dirs = [d.strip() for d in result.stdout.split('\n') if d.strip()]
-        elif st["type"] == "local":
-            base = os.path.join(st["path"], prefix)
-            if os.path.isdir(base):
-                for entry in sorted(os.listdir(base)):
-                    if os.path.isdir(os.path.join(base, entry)):
-                        dirs.append(entry)
-        return dirs
-
-    def list_remote_files(self, prefix):
-        st = self.config["storage"]
-        files = []
-        if st["type"] == "s3":
-            client = self.get_storage()
-            paginator = client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(Bucket=st["bucket"], Prefix=prefix, Delimiter='/')
-            for page in pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        name = obj['Key'][len(prefix):]
-                        if name: files.append(name)
+                for line in result.stdout.splitlines():
+                    kind, _, rel = line.partition(' ')
+                    pkg, sep, name = rel.partition('/')
+                    if kind == 'd' and not sep:
+                        tree.setdefault(pkg, [])
+                    elif kind == 'f' and sep:
+                        tree.setdefault(pkg, []).append(name)
         elif st["type"] == "local":
             base = os.path.join(st["path"], prefix)
             if os.path.isdir(base):
                 for entry in sorted(os.listdir(base)):
-                    full = os.path.join(base, entry)
-                    if os.path.isfile(full):
-                        files.append(entry)
-        return files
+                    pkg_dir = os.path.join(base, entry)
+                    if os.path.isdir(pkg_dir):
+                        tree[entry] = [f for f in sorted(os.listdir(pkg_dir))
+                                       if os.path.isfile(os.path.join(pkg_dir, f))]
+        return tree
 
     def download_index(self):
         st = self.config["storage"]
@@ -362,25 +677,36 @@ class RepoManager:
         prefix = self.config["storage"].get("path_prefix", "").strip('/')
         if prefix: prefix += '/'
         remote_path = f"{prefix}{arch}/index.txt"
-        fd, local_path = tempfile.mkstemp()
-        os.close(fd)
-        try:
-            if st["type"] == "s3":
-                client = self.get_storage()
-                client.download_file(st["bucket"], remote_path, local_path)
-            elif st["type"] == "scp":
-                host = st["host"]
-                user = st["user"]
-                remote_base_path = st["remote_path"].rstrip('/')
-                subprocess.run(["scp", f"{user}@{host}:{remote_base_path}/{remote_path}", local_path], check=True)
-            elif st["type"] == "local":
-                src = os.path.join(st["path"], remote_path)
-                if os.path.exists(src):
-                    import shutil
-                    shutil.copy2(src, local_path)
-        except Exception:
-            with open(local_path, 'w', encoding='utf-8') as f: pass
-        return local_path
+        # index 很小，直接读进内存，不落临时文件。
+        # 只有 index 不存在才视为空 index；其他错误（认证、网络、配置）必须中止，
+        # 否则随后 push/delete 会用残缺的 index 覆盖远端，cleanup 会删光所有包
+        data = b""
+        if st["type"] == "s3":
+            from botocore.exceptions import ClientError
+            client = self.get_storage()
+            try:
+                data = client.get_object(Bucket=st["bucket"], Key=remote_path)["Body"].read()
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404", "NotFound"):
+                    raise
+        elif st["type"] == "scp":
+            ssh_target = self._ssh_target()
+            remote_base_path = st["remote_path"].rstrip('/')
+            target = shlex.quote(f"{remote_base_path}/{remote_path}")
+            # 文件不存在时输出为空且返回 0；ssh 或读取失败时返回非 0
+            result = subprocess.run(["ssh", *SSH_MUX_OPTS, ssh_target, f"test ! -e {target} || cat {target}"],
+                                    capture_output=True, check=True)
+            data = result.stdout
+        elif st["type"] == "local":
+            src = os.path.join(st["path"], remote_path)
+            try:
+                with open(src, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                pass
+        else:
+            raise ValueError(f"Unknown storage type: {st['type']}")
+        return data.decode('utf-8')
 
 def init_local_repo(path, arch="x86_64"):
     """Initialize a local repo at the given path with the given architecture."""
@@ -401,6 +727,7 @@ def main():
     subparsers = parser.add_subparsers(dest="command")
     push_parser = subparsers.add_parser("push", help="Push packages to repository")
     push_parser.add_argument("patterns", nargs="+", help="File patterns/directories to push")
+    push_parser.add_argument("--no-cache", action="store_true", help="Ignore the local hash/metadata cache and re-process every package")
     delete_parser = subparsers.add_parser("delete", help="Delete package or specific version")
     delete_parser.add_argument("package", help="Package name or name:version")
     subparsers.add_parser("cleanup", help="Remove all historical versions not in index.txt")
@@ -413,7 +740,7 @@ def main():
     if args.path:
         mgr.config["storage"] = {"type": "local", "path": os.path.abspath(args.path)}
         init_local_repo(os.path.abspath(args.path), mgr.config.get("architecture", "x86_64"))
-    if args.command == "push": mgr.push_packages(args.patterns)
+    if args.command == "push": mgr.push_packages(args.patterns, use_cache=not args.no_cache)
     elif args.command == "delete":
         if ':' in args.package:
             name, ver = args.package.split(':', 1)
@@ -431,7 +758,7 @@ def main():
             mgr.save_config()
             print("Config updated.")
         elif args.show or args.show_secrets:
-            cfg = json.loads(json.dumps(mgr.config))
+            cfg = copy.deepcopy(mgr.config)
             if not args.show_secrets:
                 if "storage" in cfg:
                     if "secret_key" in cfg["storage"]: cfg["storage"]["secret_key"] = "********"
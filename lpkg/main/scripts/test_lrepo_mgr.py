@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""lrepo-mgr.py 的回归测试：python3 -m unittest test_lrepo_mgr（在本目录下运行）。
+
+S3 用例依赖 boto3 + moto，.lpkg 样本依赖 zstandard；缺少时对应用例跳过。
+"""
+import importlib.util
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+
+_spec = importlib.util.spec_from_file_location(
+    "lrepo_mgr", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lrepo-mgr.py"))
+lrepo_mgr = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(lrepo_mgr)
+
+def _has(module):
+    return importlib.util.find_spec(module) is not None
+
+def make_lpkg(path, name, version):
+    """写一个最小 .lpkg：metadata.json（首项）+ 一个 content 文件。"""
+    import zstandard
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tf:
+        for member, data in (("metadata.json", json.dumps({"name": name, "version": version}).encode()),
+                             (f"content/usr/bin/{name}", os.urandom(64))):
+            ti = tarfile.TarInfo(member)
+            ti.size = len(data)
+            tf.addfile(ti, io.BytesIO(data))
+    with open(path, 'wb') as f:
+        f.write(zstandard.ZstdCompressor().compress(buf.getvalue()))
+
+class RepoTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.addCleanup(self._tmp.cleanup)
+        self.pkgs = os.path.join(self.tmp, "pkgs")
+        os.makedirs(self.pkgs)
+
+    def manager(self, storage):
+        cfg = os.path.join(self.tmp, "cfg.json")
+        with open(cfg, 'w') as f:
+            json.dump({"storage": storage, "architecture": "x86_64"}, f)
+        return lrepo_mgr.RepoManager(cfg)
+
+@unittest.skipUnless(_has("boto3") and _has("moto") and _has("zstandard"), "needs boto3, moto, zstandard")
+class S3Test(RepoTestCase):
+    STORAGE = {"type": "s3", "bucket": "bkt", "access_key": "a", "secret_key": "s", "region": "us-east-1"}
+
+    def setUp(self):
+        super().setUp()
+        from moto import mock_aws
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        import boto3
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="bkt")
+
+    def index(self):
+        return self.s3.get_object(Bucket="bkt", Key="x86_64/index.txt")["Body"].read().decode()
+
+    def test_get_storage_builds_client_and_transfer_config(self):
+        mgr = self.manager(dict(self.STORAGE, max_concurrency="4"))
+        self.assertIsNotNone(mgr.get_storage())
+        self.assertIsNotNone(mgr._transfer_config)
+        self.assertEqual(mgr._transfer_config.max_in_memory_upload_chunks, 4)
+
+    def test_second_push_keeps_existing_index_entries(self):
+        make_lpkg(os.path.join(self.pkgs, "a.lpkg"), "a", "1")
+        make_lpkg(os.path.join(self.pkgs, "b.lpkg"), "b", "1")
+        self.manager(self.STORAGE).push_packages([os.path.join(self.pkgs, "a.lpkg")], use_cache=False)
+        self.manager(self.STORAGE).push_packages([os.path.join(self.pkgs, "b.lpkg")], use_cache=False)
+        index = self.index()
+        self.assertIn("a|1:", index)
+        self.assertIn("b|1:", index)
+
+        self.manager(self.STORAGE).cleanup_repository()
+        keys = sorted(o["Key"] for o in self.s3.list_objects_v2(Bucket="bkt")["Contents"])
+        self.assertEqual(keys, ["x86_64/a/1.lpkg", "x86_64/b/1.lpkg", "x86_64/index.txt"])
+
+    def test_missing_index_is_empty_but_other_errors_abort(self):
+        self.assertEqual(self.manager(self.STORAGE).download_index(), "")
+        from botocore.exceptions import ClientError
+        with self.assertRaises(ClientError):
+            self.manager(dict(self.STORAGE, bucket="no-such-bucket")).download_index()
+
+class ExpandPatternsTest(RepoTestCase):
+    def touch(self, *parts):
+        path = os.path.join(self.tmp, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+        return path
+
+    def test_keeps_command_line_order(self):
+        old = [self.touch("old", n) for n in ("a.lpkg", "b.lpkg")]
+        new = self.touch("new", "a.lpkg")
+        files = lrepo_mgr.expand_patterns([os.path.join(self.tmp, "old", "*.lpkg"), new])
+        self.assertEqual(sorted(files[:2]), sorted(old))
+        self.assertEqual(files[2], new)
+        files = lrepo_mgr.expand_patterns([new, os.path.join(self.tmp, "old", "*.lpkg")])
+        self.assertEqual(files[0], new)
+
+    def test_dedupes_and_matches_hidden_files_like_glob(self):
+        visible = self.touch("d", "a.lpkg")
+        hidden = self.touch("d", ".b.lpkg")
+        d = os.path.join(self.tmp, "d")
+        self.assertEqual(lrepo_mgr.expand_patterns([os.path.join(d, "*"), os.path.join(d, "a*")]), [visible])
+        self.assertEqual(lrepo_mgr.expand_patterns([os.path.join(d, ".*")]), [hidden])
+
+class S3DeleteErrorsTest(RepoTestCase):
+    class StubClient:
+        """只实现 delete_objects：每批都报第一个 key 删除失败。"""
+        def __init__(self):
+            self.batches = []
+
+        def delete_objects(self, Bucket, Delete):
+            keys = [o['Key'] for o in Delete['Objects']]
+            self.batches.append(keys)
+            return {"Errors": [{"Key": keys[0], "Code": "AccessDenied", "Message": "Access Denied"}]}
+
+    def test_failed_keys_raise_after_all_batches(self):
+        mgr = self.manager({"type": "s3", "bucket": "bkt"})
+        stub = self.StubClient()
+        mgr.get_storage = lambda: stub
+        keys = [f"x86_64/p/{i}.lpkg" for i in range(lrepo_mgr.S3_DELETE_BATCH + 1)]
+        with self.assertRaises(RuntimeError):
+            mgr.delete_remote_files(keys)
+        self.assertEqual(sum(len(b) for b in stub.batches), len(keys))
+
+class UnknownStorageTest(RepoTestCase):
+    def test_uploads_reject_unknown_storage_type(self):
+        mgr = self.manager({"type": "ftp"})
+        with self.assertRaises(ValueError):
+            mgr.upload_bytes(b"", "x86_64/index.txt")
+        with self.assertRaises(ValueError):
+            mgr.download_index()
+
+class LocalTest(RepoTestCase):
+    def test_missing_index_is_empty_but_other_errors_abort(self):
+        repo = os.path.join(self.tmp, "repo")
+        mgr = self.manager({"type": "local", "path": repo})
+        self.assertEqual(mgr.download_index(), "")
+        # index.txt 读不了（这里是个目录）时不能当成空 index
+        os.makedirs(os.path.join(repo, "x86_64", "index.txt"))
+        with self.assertRaises(OSError):
+            mgr.download_index()
+
+if __name__ == "__main__":
+    unittest.main()